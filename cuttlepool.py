@@ -7,6 +7,8 @@ CuttlePool.
 
 __version__ = '0.10.0-dev'
 
+import collections
+import functools
 try:
     import threading
 except ImportError:
@@ -17,6 +19,9 @@ import weakref
 
 _OVERFLOW = 0
 _TIMEOUT = None
+# Number of yield-and-retry attempts a depleted borrow makes before parking
+# on the condition variable.
+_SPIN_TRIES = 4
 
 
 class CuttlePool(object):
@@ -62,24 +67,58 @@ class CuttlePool(object):
         self._factory = factory
         self._resource_wrapper = resource_wrapper or Resource
         self._factory_arguments = kwargs
-
-        # The reference queue is divided in two sections. One section is a
-        # queue of resources that are ready for use (the available region).
-        # The other section is an unordered list of resources that are
-        # currently in use and NoneType objects (the unavailable region).
-        self._reference_queue = [None] * self.maxsize
-        self._resource_start = self._resource_end = 0
-        # _size is the number of existing resources. _available is the
-        # number of available resources.
-        self._size = self._available = 0
+        # The factory call is bound with its arguments once so making a
+        # resource doesn't rebuild the kwargs dict every time.
+        self._factory_bound = functools.partial(factory, **kwargs)
+
+        # Resources that are ready for use wait in a deque, used as a LIFO
+        # stack. The push/pop methods are bound once so borrows and returns
+        # skip the attribute lookup and method binding on every call.
+        self._queue = collections.deque()
+        self._queue_push = self._queue.append
+        self._queue_pop = self._queue.pop
+        # Maps id(resource) -> _ResourceTracker for every existing resource,
+        # in the pool or in use, so a tracker can be found without scanning
+        # the queue.
+        self._tracker_map = {}
+        # Trackers whose reclaim callback fired while the pool lock was
+        # unavailable wait here until a locked operation drains them.
+        self._lost = collections.deque()
+        # _size is the number of existing resources.
+        self._size = 0
+
+        # Preallocated so a depleted pool doesn't construct a fresh
+        # exception on every timed-out borrow.
+        self._empty_error = PoolEmptyError()
 
         # Required for locking the resource pool in multi-threaded
-        # environments.
-        self._lock = threading.RLock()
+        # environments. A plain Lock is used instead of an RLock since it is
+        # cheaper to acquire; no critical section re-enters the lock.
+        self._lock = threading.Lock()
         # Notify thread waiting for resource that the queue is not empty when
         # a resource is returned to the pool.
         self._not_empty = threading.Condition(self._lock)
 
+        # Warn once at construction when the user hooks haven't been
+        # implemented instead of on every get_resource() call.
+        cls = type(self)
+        if (cls.normalize_resource == CuttlePool.normalize_resource
+                and cls.normalize_connection == CuttlePool.normalize_connection):
+            warnings.warn('Failing to implement normalize_resource() can '
+                          'result in unwanted behavior.')
+        if cls.ping == CuttlePool.ping:
+            warnings.warn('Failing to implement ping() can result in '
+                          'unwanted behavior.')
+        # Subclasses that only override the deprecated normalize_connection()
+        # are routed to it here so get_resource() can call
+        # normalize_resource() directly.
+        if (cls.normalize_connection != CuttlePool.normalize_connection
+                and cls.normalize_resource == CuttlePool.normalize_resource):
+            warnings.warn(('normalize_connection is deprecated in favor of '
+                           'normalize_resource and will be removed in 1.0'),
+                          DeprecationWarning)
+            self.normalize_resource = self.normalize_connection
+
     @property
     def capacity(self):
         """
@@ -134,6 +173,11 @@ class CuttlePool(object):
         with self._lock:
             return self._size
 
+    @property
+    def _available(self):
+        """The number of available resources in the pool."""
+        return len(self._queue)
+
     @property
     def timeout(self):
         """
@@ -157,19 +201,29 @@ class CuttlePool(object):
         """
         with self._lock:
             if timeout is None:
-                while self.empty():
+                while not self._queue:
                     self._not_empty.wait()
             else:
                 time_end = time.time() + timeout
-                while self.empty():
+                while not self._queue:
                     time_left = time_end - time.time()
                     if time_left < 0:
-                        raise PoolEmptyError
+                        # Clear the traceback and context left by any
+                        # previous raise of the shared instance so frames
+                        # and unrelated exceptions don't accumulate.
+                        self._empty_error.__traceback__ = None
+                        self._empty_error.__context__ = None
+                        raise self._empty_error
                     self._not_empty.wait(time_left)
 
-            rtracker = self._reference_queue[self._resource_start]
-            self._resource_start = (self._resource_start + 1) % self.maxsize
-            self._available -= 1
+            # Resources are reused LIFO so the most recently returned
+            # resource, whose backing connection is warmest, goes out first
+            # and idle resources age out for ping eviction.
+            rtracker = self._queue_pop()
+            rtracker._in_pool = False
+            # Clear the stale weakref from the previous loan so the tracker
+            # can't be mistaken for a lost resource before it is wrapped.
+            rtracker._weakref = None
 
         return rtracker
 
@@ -182,36 +236,186 @@ class CuttlePool(object):
         :rtype: :class:`_ResourceTracker`
         """
         with self._lock:
-            for rt in self._reference_queue:
-                if rt is not None and resource is rt.resource:
-                    return rt
+            rtracker = self._tracker_map.get(id(resource))
+            if rtracker is not None:
+                return rtracker
 
         raise UnknownResourceError('Resource not created by pool')
 
+    def _acquire_tracker(self):
+        """
+        Find, make, or wait for a resource when none is immediately
+        available. This is the slow path of :meth:`get_resource`, kept
+        separate so the common case stays straight-line.
+
+        :return: A resource tracker.
+        :rtype: :class:`_ResourceTracker`
+
+        :raises PoolEmptyError: If attempt to get resource fails or times
+            out.
+        """
+        # Reclaim any lost resources and retry before falling through to
+        # making or waiting for one.
+        self._harvest_lost_resources()
+        try:
+            return self._get(0)
+        except PoolEmptyError:
+            pass
+
+        # Could not find a resource, try to make one.
+        try:
+            return self._make_resource()
+        except PoolFullError:
+            pass
+
+        # Could not find or make a resource. Yield the GIL and retry a few
+        # times in case one is returned imminently, skipping the condition
+        # variable handoff, before parking until a resource comes back.
+        for _ in range(_SPIN_TRIES):
+            time.sleep(0)
+            try:
+                return self._get(0)
+            except PoolEmptyError:
+                pass
+
+        try:
+            return self._get(timeout=self._timeout)
+        except PoolEmptyError:
+            # This raise escapes to the caller, so use a fresh instance;
+            # the shared one is reserved for the non-blocking misses caught
+            # inside the pool, where concurrent callers could otherwise
+            # mutate each other's traceback. Timeouts are rare and already
+            # slow, so the allocation doesn't matter here.
+            raise PoolEmptyError
+
+    def _drain_lost(self):
+        """
+        Reclaim trackers parked by ``_reclaim_tracker``. The caller must
+        hold ``_lock``.
+        """
+        while self._lost:
+            self._reclaim(self._lost.popleft())
+
     def _harvest_lost_resources(self):
         """Return lost resources to pool."""
         with self._lock:
-            for i in self._unavailable_range():
-                rtracker = self._reference_queue[i]
-                if rtracker is not None and rtracker.available():
-                    self.put_resource(rtracker.resource)
+            self._drain_lost()
+            # Only trackers whose wrapper has been garbage collected are
+            # lost; a tracker with no weakref at all is mid-loan.
+            lost = [rtracker for rtracker in self._tracker_map.values()
+                    if (not rtracker._in_pool
+                        and rtracker._weakref is not None
+                        and rtracker.available())]
+            if not lost:
+                return
+
+            # Requeue as many as fit in one batch; anything over capacity
+            # is discarded. Waiters are notified once for the whole batch.
+            space = self.capacity - self._available
+            for rtracker in lost[:space]:
+                self._queue_push(rtracker)
+                rtracker._in_pool = True
+            for rtracker in lost[space:]:
+                self._discard_tracker(rtracker)
+
+            returned = min(len(lost), space)
+            if returned:
+                self._not_empty.notify(returned)
 
     def _make_resource(self):
         """
         Returns a resource instance.
+
+        Space for the resource is reserved under the lock, but the factory
+        itself runs without it so a slow factory (e.g. a database connect)
+        doesn't block other borrowers.
+
+        :raises PoolFullError: If all spaces in the pool are taken.
         """
         with self._lock:
-            for i in self._unavailable_range():
-                if self._reference_queue[i] is None:
-                    rtracker = _ResourceTracker(
-                        self._factory(**self._factory_arguments))
+            if self._size >= self.maxsize:
+                raise PoolFullError
+            # Reserve space for the resource before making it so other
+            # threads can't oversubscribe the pool in the meantime.
+            self._size += 1
 
-                    self._reference_queue[i] = rtracker
-                    self._size += 1
+        try:
+            rtracker = _ResourceTracker(self._factory_bound())
+        except Exception:
+            with self._lock:
+                self._size -= 1
+            raise
 
-                    return rtracker
+        with self._lock:
+            self._tracker_map[id(rtracker.resource)] = rtracker
 
-            raise PoolFullError
+        return rtracker
+
+    def _replace_tracker(self, rtracker):
+        """
+        Replace a dead resource with a newly made one.
+
+        The replacement is created before the registry is touched, so the
+        dead resource keeps its space in the pool while the factory runs --
+        the pool can't be oversubscribed and the factory call doesn't hold
+        the lock. The swap itself is a single critical section.
+
+        :param rtracker: The tracker of the dead resource.
+        :type rtracker: :class:`_ResourceTracker`
+        :return: A resource tracker for the replacement.
+        :rtype: :class:`_ResourceTracker`
+        """
+        try:
+            new_rtracker = _ResourceTracker(self._factory_bound())
+        except Exception:
+            # The dead resource can't be replaced, so give up its space;
+            # otherwise it would be counted against the pool's size forever.
+            with self._lock:
+                self._discard_tracker(rtracker)
+            raise
+
+        with self._lock:
+            self._discard_tracker(rtracker)
+            self._tracker_map[id(new_rtracker.resource)] = new_rtracker
+            self._size += 1
+
+        return new_rtracker
+
+    def _reclaim(self, rtracker):
+        """
+        Return a lost tracker to the pool. The caller must hold ``_lock``.
+
+        :param rtracker: A resource.
+        :type rtracker: :class:`_ResourceTracker`
+        """
+        if rtracker._in_pool or id(rtracker.resource) not in self._tracker_map:
+            return
+        if rtracker._weakref is None or rtracker._weakref() is not None:
+            # The tracker has been handed out again since the callback fired.
+            return
+
+        try:
+            self._return_tracker(rtracker)
+        except PoolFullError:
+            self._discard_tracker(rtracker)
+
+    def _reclaim_tracker(self, rtracker):
+        """
+        Return a tracker whose resource wrapper was garbage collected to the
+        pool. Runs as a weakref callback, so it can fire while the current
+        thread holds the pool lock; in that case the tracker is parked and
+        picked up by the next harvest.
+
+        :param rtracker: A resource.
+        :type rtracker: :class:`_ResourceTracker`
+        """
+        if self._lock.acquire(False):
+            try:
+                self._reclaim(rtracker)
+            finally:
+                self._lock.release()
+        else:
+            self._lost.append(rtracker)
 
     def _put(self, rtracker):
         """
@@ -224,25 +428,29 @@ class CuttlePool(object):
         :raises UnknownResourceError: If resource can't be found.
         """
         with self._lock:
-            if self._available < self.capacity:
-                for i in self._unavailable_range():
-                    if self._reference_queue[i] is rtracker:
-                        # i retains its value and will be used to swap with
-                        # first "empty" space in queue.
-                        break
-                else:
-                    raise UnknownResourceError
-
-                j = self._resource_end
-                rq = self._reference_queue
-                rq[i], rq[j] = rq[j], rq[i]
-
-                self._resource_end = (self._resource_end + 1) % self.maxsize
-                self._available += 1
-
-                self._not_empty.notify()
-            else:
-                raise PoolFullError
+            self._return_tracker(rtracker)
+
+    def _return_tracker(self, rtracker):
+        """
+        Put a resource back in the queue. The caller must hold ``_lock``.
+
+        :param rtracker: A resource.
+        :type rtracker: :class:`_ResourceTracker`
+
+        :raises PoolFullError: If pool is full.
+        :raises UnknownResourceError: If resource can't be found.
+        """
+        if self._available < self.capacity:
+            if (self._tracker_map.get(id(rtracker.resource)) is not rtracker
+                    or rtracker._in_pool):
+                raise UnknownResourceError
+
+            self._queue_push(rtracker)
+            rtracker._in_pool = True
+
+            self._not_empty.notify()
+        else:
+            raise PoolFullError
 
     def _remove(self, rtracker):
         """
@@ -252,23 +460,17 @@ class CuttlePool(object):
         :type rtracker: :class:`_ResourceTracker`
         """
         with self._lock:
-            i = self._reference_queue.index(rtracker)
-            self._reference_queue[i] = None
-            self._size -= 1
+            self._discard_tracker(rtracker)
 
-    def _unavailable_range(self):
-        """
-        Return a generator for the indices of the unavailable region of
-        ``_reference_queue``.
+    def _discard_tracker(self, rtracker):
         """
-        with self._lock:
-            i = self._resource_end
-            j = self._resource_start
-            if j < i or self.empty():
-                j += self.maxsize
+        Remove a resource from the pool. The caller must hold ``_lock``.
 
-            for k in range(i, j):
-                yield k % self.maxsize
+        :param rtracker: A resource.
+        :type rtracker: :class:`_ResourceTracker`
+        """
+        del self._tracker_map[id(rtracker.resource)]
+        self._size -= 1
 
     def empty(self):
         """Return ``True`` if pool is empty."""
@@ -292,57 +494,35 @@ class CuttlePool(object):
         :raises PoolEmptyError: If attempt to get resource fails or times
             out.
         """
-        rtracker = None
-
         if resource_wrapper is None:
             resource_wrapper = self._resource_wrapper
 
-        with self._lock:
-            if self.empty():
-                self._harvest_lost_resources()
-
-            try:
-                rtracker = self._get(0)
-            except PoolEmptyError:
-                pass
-
-            if rtracker is None:
-                # Could not find resource, try to make one.
-                try:
-                    rtracker = self._make_resource()
-                except PoolFullError:
-                    pass
-
-            if rtracker is None:
-                # Could not find or make resource, so must wait for a resource
-                # to be returned to the pool.
-                try:
-                    rtracker = self._get(timeout=self._timeout)
-                except PoolEmptyError:
-                    pass
-
-            if rtracker is None:
-                raise PoolEmptyError
+        try:
+            rtracker = self._get(0)
+        except PoolEmptyError:
+            rtracker = self._acquire_tracker()
 
+        try:
             # Ensure resource is active.
             if not self.ping(rtracker.resource):
-                # Lock here to prevent another thread creating a resource in the
-                # index that will have this resource removed. This ensures there
-                # will be space for _make_resource() to place a newly created
-                # resource.
-                with self._lock:
-                    self._remove(rtracker)
-                    rtracker = self._make_resource()
-
-            # Ensure all resources leave pool with same attributes.
-            # normalize_connection() is used since it calls
-            # normalize_resource(), so if a user implements either one, the
-            # resource will still be normalized. This will be changed in 1.0 to
-            # call normalize_resource() when normalize_connection() is
-            # removed.
-            self.normalize_connection(rtracker.resource)
+                rtracker = self._replace_tracker(rtracker)
+
+            # Ensure all resources leave pool with same attributes. A user
+            # implementing only the deprecated normalize_connection() is
+            # still supported; __init__ routes normalize_resource() to it.
+            self.normalize_resource(rtracker.resource)
 
             return rtracker.wrap_resource(self, resource_wrapper)
+        except Exception:
+            # A hook or the wrapper constructor failed mid-loan. The tracker
+            # has no weakref at this point so the harvest can't reclaim it;
+            # give its space back before propagating. _replace_tracker
+            # discards the dead tracker itself on failure, hence the
+            # registry check.
+            with self._lock:
+                if self._tracker_map.get(id(rtracker.resource)) is rtracker:
+                    self._discard_tracker(rtracker)
+            raise
 
     def normalize_connection(self, connection):
         """For compatibility with older versions, will be removed in 1.0."""
@@ -360,8 +540,6 @@ class CuttlePool(object):
 
         :param obj resource: A resource instance.
         """
-        warnings.warn('Failing to implement normalize_resource() can '
-                      'result in unwanted behavior.')
 
     def ping(self, resource):
         """
@@ -373,8 +551,6 @@ class CuttlePool(object):
         :return: A bool indicating if the resource is open (``True``) or
             closed (``False``).
         """
-        warnings.warn('Failing to implement ping() can result in unwanted '
-                      'behavior.')
         return True
 
     def put_connection(self, connection):
@@ -393,12 +569,20 @@ class CuttlePool(object):
         :raises UnknownResourceError: If resource was not made by the
                                         pool.
         """
-        rtracker = self._get_tracker(resource)
+        with self._lock:
+            rtracker = self._tracker_map.get(id(resource))
+            if rtracker is None:
+                raise UnknownResourceError('Resource not created by pool')
 
-        try:
-            self._put(rtracker)
-        except PoolFullError:
-            self._remove(rtracker)
+            # The resource is being returned deliberately, so disarm the
+            # reclaim callback by dropping the weakref; the closed wrapper's
+            # eventual collection then does no work at all.
+            rtracker._weakref = None
+
+            try:
+                self._return_tracker(rtracker)
+            except PoolFullError:
+                self._discard_tracker(rtracker)
 
 
 class _ResourceTracker(object):
@@ -408,9 +592,14 @@ class _ResourceTracker(object):
     :param resource: A resource instance.
     """
 
+    __slots__ = ('resource', '_weakref', '_in_pool')
+
     def __init__(self, resource):
         self.resource = resource
         self._weakref = None
+        # True while the tracker is waiting in the pool's queue of available
+        # resources, maintained by the pool.
+        self._in_pool = False
 
     def available(self):
         """Determine if resource available for use."""
@@ -428,7 +617,14 @@ class _ResourceTracker(object):
         :rtype: :class:`Resource`
         """
         resource = resource_wrapper(self.resource, pool)
-        self._weakref = weakref.ref(resource)
+
+        def callback(ref, pool=pool, rtracker=self):
+            pool._reclaim_tracker(rtracker)
+
+        # The callback returns the tracker to the pool as soon as the
+        # wrapper is garbage collected. Dropping the weakref (as _get does
+        # when the tracker is handed out again) disarms it.
+        self._weakref = weakref.ref(resource, callback)
         return resource
 
 
@@ -440,6 +636,9 @@ class Resource(object):
     :param pool: A resource pool.
     """
 
+    # __weakref__ is required since the pool tracks wrappers by weakref.
+    __slots__ = ('_resource', '_pool', '__weakref__')
+
     def __init__(self, resource, pool):
         object.__setattr__(self, '_resource', resource)
         object.__setattr__(self, '_pool', pool)
@@ -458,10 +657,10 @@ class Resource(object):
 
     def __setattr__(self, name, value):
         """Sets attributes of resource object."""
-        if name not in self.__dict__:
-            setattr(self._resource, name, value)
-        else:
+        if name in ('_resource', '_pool'):
             object.__setattr__(self, name, value)
+        else:
+            setattr(self._resource, name, value)
 
     def close(self):
         """
@@ -469,8 +668,9 @@ class Resource(object):
         """
         if self._resource is not None:
             self._pool.put_resource(self._resource)
-            self._resource = None
-            self._pool = None
+            # Set directly to skip the __setattr__ forwarding logic.
+            object.__setattr__(self, '_resource', None)
+            object.__setattr__(self, '_pool', None)
 
 
 class CuttlePoolError(Exception):
@@ -495,6 +695,8 @@ class UnknownResourceError(CuttlePoolError):
 class PoolConnection(Resource):
     """For compatibility with older versions, will be removed in 1.0."""
 
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         warnings.warn(('PoolConnection is deprecated in favor of Resource and '
                        'will be removed in 1.0'), DeprecationWarning)
@@ -15,7 +15,7 @@ if int(pytest.__version__.split('.')[0]) >= 3:
     pytest.yield_fixture = pytest.fixture
 
 from cuttlepool import (_ResourceTracker, CuttlePool, Resource, PoolEmptyError,
-                        PoolFullError)
+                        PoolFullError, UnknownResourceError)
 import mockresource
 
 
@@ -196,37 +196,24 @@ def test_remove(pool, rtracker):
     """Test ``_remove()`` removes resource from pool."""
     pool._remove(rtracker)
     assert pool.size == pool._available == 0
-    assert list(filter(None, pool._reference_queue)) == []
+    assert pool._tracker_map == {}
 
 
-def test_unavailable_range(pool):
-    """Test proper generator returned for unused pool."""
-    assert list(pool._unavailable_range()) == [x for x in range(pool.maxsize)]
-
-
-def test_unavailable_range_depleted_pool(pool):
-    """Test generator when pool is depleted."""
-    resources = [pool.get_resource() for _ in range(pool.maxsize)]
-    assert list(pool._unavailable_range()) == [x for x in range(pool.maxsize)]
-
+def test_in_pool_flag(pool, rtracker):
+    """Test the in pool flag follows put/get transitions."""
+    assert not rtracker._in_pool
+    pool._put(rtracker)
+    assert rtracker._in_pool
+    rt = pool._get(0)
+    assert rt is rtracker
+    assert not rt._in_pool
 
-def test_unavailable_range_wraps(pool, capacity):
-    """
-    Test generator uses correct indices when ``_resource_start`` is less than
-    ``_resource_end``.
-    """
-    # Create capacity resources, then return them to the pool. This makes
-    # _resource_end == capacity.
-    resources = [pool.get_resource() for _ in range(capacity)]
-    [r.close() for r in resources]
-    # Get a resource, which makes _resource_start == 1.
-    r = pool.get_resource()
 
-    # The unavailable range starts at _resource_end (5) and wraps around to
-    # _resource_start (1, exclusive).
-    unavailable = list(range(capacity, pool.maxsize))
-    unavailable.extend(range(pool._resource_start))
-    assert list(pool._unavailable_range()) == unavailable
+def test_put_twice(pool, rtracker):
+    """Test a resource already in the pool can't be put again."""
+    pool._put(rtracker)
+    with pytest.raises(UnknownResourceError):
+        pool._put(rtracker)
 
 
 def test_get_resource(pool):
@@ -319,6 +306,24 @@ def test_ping(pool):
     assert r_id != r2_id
 
 
+def test_lifo_reuse(pool):
+    """Test the most recently returned resource is handed out first."""
+    r1 = pool.get_resource()
+    r2 = pool.get_resource()
+    r1_id = id(r1._resource)
+    r2_id = id(r2._resource)
+
+    r1.close()
+    r2.close()
+
+    # Keep the wrappers referenced so the reclaim callback doesn't return
+    # a resource to the pool mid-test.
+    r3 = pool.get_resource()
+    r4 = pool.get_resource()
+    assert id(r3._resource) == r2_id
+    assert id(r4._resource) == r1_id
+
+
 def test_put_resource(pool):
     """
     Test that the resource is properly returned to the pool.
@@ -371,7 +376,10 @@ def test_resource_getattr_setattr(resource):
     """Test that attributes are set on the underlying resource object."""
     resource.one = 1
     assert resource.one == 1
-    assert 'one' not in resource.__dict__
+    # The attribute should live on the wrapped resource object, not the
+    # wrapper itself.
+    with pytest.raises(AttributeError):
+        object.__getattribute__(resource, 'one')
     assert resource._resource.one == 1
     assert 'one' in resource._resource.__dict__
     assert resource.one == resource._resource.one